@@ -1,15 +1,36 @@
 import os
+import shutil
+import tempfile
+import threading
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import Annotated
 
 import duckdb
+import orjson
 import requests
-from fastapi import APIRouter, status
+from fastapi import APIRouter, Response, status
 from fastapi.params import Query
+from isal import igzip
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from bdi_api.settings import Settings
 
 settings = Settings()
 
+# Shared HTTP session so the hourly files reuse pooled keep-alive connections
+session = requests.Session()
+session.mount(
+    "https://",
+    HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=Retry(total=3, backoff_factor=0.3)),
+)
+
+# Read-only connection shared by the GET endpoints, opened on first use
+_conn: duckdb.DuckDBPyConnection | None = None
+_conn_lock = threading.Lock()
+
 s1 = APIRouter(
     responses={
         status.HTTP_404_NOT_FOUND: {"description": "Not found"},
@@ -20,6 +41,249 @@ s1 = APIRouter(
 )
 
 
+def _download_file(file_url: str, file_path: str) -> bool:
+    """Downloads a single file, returning whether it was stored.
+
+    The ETag of a stored file is kept next to it in a `.etag` file so the next
+    download is conditional, a 304 means the file we have is still current
+    """
+    etag_path = file_path + ".etag"
+    headers = {}
+    if os.path.exists(file_path) and os.path.exists(etag_path):
+        with open(etag_path) as f:
+            headers["If-None-Match"] = f.read()
+
+    try:
+        with session.get(file_url, headers=headers, timeout=30, stream=True) as response:
+            if response.status_code == 304:
+                return True
+            if response.status_code != 200:
+                return False
+            # Forget the old ETag first so a failed write is never taken as current
+            if os.path.exists(etag_path):
+                os.remove(etag_path)
+            # The files are gzip-encoded on the wire only: decode them while
+            # streaming so they are stored as plain JSON, as prepare_data expects
+            response.raw.decode_content = True
+            with open(file_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, length=128 * 1024)
+            etag = response.headers.get("ETag")
+            if etag:
+                with open(etag_path, 'w') as f:
+                    f.write(etag)
+        return True
+    except Exception:
+        # Skip files that don't exist or can't be downloaded
+        return False
+
+
+def _json_response(rows: list[dict]) -> Response:
+    """Encodes rows that are already JSON-ready with orjson, skipping
+    FastAPI's per-row response validation and encoding
+    """
+    return Response(content=orjson.dumps(rows), media_type="application/json")
+
+
+def _decompress_file(file_path: str, output_dir: str) -> str:
+    """Returns a path to the file's plain JSON, gunzipping it into
+    `output_dir` only when it is actually gzip-compressed
+    """
+    with open(file_path, 'rb') as f:
+        if f.read(2) != b"\x1f\x8b":
+            return file_path
+
+    output_path = os.path.join(output_dir, os.path.basename(file_path).removesuffix('.gz'))
+    with igzip.open(file_path, 'rb') as src, open(output_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, length=128 * 1024)
+    return output_path
+
+
+def _decompress_json_files(json_files: list[str], output_dir: str) -> list[str]:
+    """Returns the plain JSON paths for `json_files`, decompressing them in parallel.
+
+    The source serves the files gzip-encoded and they are usually stored decoded,
+    but any that are stored compressed are inflated with ISA-L into `output_dir`.
+    """
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return list(executor.map(lambda file_path: _decompress_file(file_path, output_dir), json_files))
+
+
+def _configure_duckdb(conn: duckdb.DuckDBPyConnection) -> None:
+    """Parallelizes the JSON ingest over all the cores and applies the configured
+    memory limit and spill directory, DuckDB's defaults are kept when unset
+    """
+    conn.execute(f"PRAGMA threads={os.cpu_count() or 1}")
+    conn.execute("PRAGMA enable_object_cache=true")
+    if settings.duckdb_memory_limit:
+        conn.execute("SET memory_limit = ?", [settings.duckdb_memory_limit])
+    if settings.duckdb_temp_dir:
+        conn.execute("SET temp_directory = ?", [settings.duckdb_temp_dir])
+
+
+def _get_conn() -> duckdb.DuckDBPyConnection:
+    """Returns the shared read-only connection to the prepared database.
+    Use a `cursor()` per request, the connection itself is not thread-safe.
+    """
+    global _conn
+    with _conn_lock:
+        if _conn is None:
+            _conn = duckdb.connect(os.path.join(settings.prepared_dir, "aircraft.db"), read_only=True)
+            _conn.execute(f"PRAGMA threads={os.cpu_count() or 1}")
+        return _conn
+
+
+@contextmanager
+def _closed_connection() -> Iterator[None]:
+    """Closes the shared connection and keeps it closed until the block ends, so
+    the prepared database can be rewritten. A read endpoint waits for the lock
+    instead of reopening the database read-only halfway through, DuckDB would then
+    refuse the read-write connection to the same file
+    """
+    global _conn
+    with _conn_lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+        yield
+
+
+def build_prepared(json_files: list[str], prepared_dir: str) -> None:
+    """Replaces the prepared database and Parquet files in `prepared_dir` with
+    ones built from the raw `json_files`, leaving it empty when there are none.
+    Shared by the s1 and s4 prepare endpoints.
+    """
+    os.makedirs(prepared_dir, exist_ok=True)
+
+    # Release the read endpoints' connection until the new database is complete
+    with _closed_connection():
+        _write_prepared(json_files, prepared_dir)
+
+
+def _write_prepared(json_files: list[str], prepared_dir: str) -> None:
+    """Does the work of `build_prepared`, with the shared connection held closed"""
+    # Database and Parquet paths
+    db_path = os.path.join(prepared_dir, "aircraft.db")
+    aircraft_path = os.path.join(prepared_dir, "aircraft.parquet")
+    positions_dir = os.path.join(prepared_dir, "positions")
+
+    # Remove existing database and Parquet files
+    for path in (db_path, aircraft_path):
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except (PermissionError, OSError):
+                pass
+    shutil.rmtree(positions_dir, ignore_errors=True)
+
+    if not json_files:
+        return
+
+    # Connect to database
+    conn = duckdb.connect(db_path)
+    # Plain JSON copies of the files that are actually gzip-compressed
+    decompressed_dir = tempfile.mkdtemp()
+
+    try:
+        _configure_duckdb(conn)
+
+        # DuckDB reads the files as plain JSON, gunzip the ones that are compressed
+        json_files = _decompress_json_files(json_files, decompressed_dir)
+
+        # Read all JSON files directly with DuckDB and unnest aircraft array.
+        # The explicit columns skip schema detection and only parse the fields we keep,
+        # missing ones come back as NULL
+        # Use struct_extract to handle fields, altitude is narrowed to INTEGER right away
+        # (TRY_CAST returns NULL for "ground" and other non-numeric values)
+        # The rows are materialized once as both Parquet files are built from them, DuckDB
+        # would parse the JSON again for each COPY reading a subquery or a view
+        conn.execute("""
+            CREATE TEMP TABLE raw_data_expanded AS
+            SELECT
+                json.now as doc_timestamp,
+                struct_extract(aircraft, 'hex') as hex,
+                struct_extract(aircraft, 'r') as r,
+                struct_extract(aircraft, 't') as t,
+                struct_extract(aircraft, 'lat') as lat,
+                struct_extract(aircraft, 'lon') as lon,
+                TRY_CAST(struct_extract(aircraft, 'alt_baro') AS INTEGER) as altitude_baro,
+                struct_extract(aircraft, 'gs') as gs
+            FROM (
+                SELECT json, unnest(json.aircraft) as aircraft
+                FROM read_json(
+                    ?, format='auto', compression='uncompressed', maximum_object_size=10000000,
+                    columns={
+                        'now': 'DOUBLE',
+                        'aircraft': 'STRUCT(hex VARCHAR, r VARCHAR, t VARCHAR, lat DOUBLE, lon DOUBLE,
+                                            alt_baro VARCHAR, gs DOUBLE)[]'
+                    }
+                ) as json
+            )
+            WHERE struct_extract(aircraft, 'hex') IS NOT NULL
+        """, [json_files])
+
+        # Persist both tables as ZSTD-compressed Parquet whose row group stats let
+        # DuckDB skip data, with positions partitioned by icao prefix so a lookup
+        # by icao only reads a single directory
+        # No indexes are needed: rows are written sorted by icao (and time) so the
+        # min/max stats stay tight. The partitioned writer may flush a partition's
+        # chunks slightly out of order, which is why the read queries sort explicitly
+        # COPY and the view definitions take no bound parameters, so the paths are
+        # spliced in as SQL literals with their quotes doubled
+        aircraft_file = aircraft_path.replace('\\', '/').replace("'", "''")
+        positions_target = positions_dir.replace('\\', '/').replace("'", "''")
+
+        conn.execute(f"""
+            COPY (
+                SELECT
+                    hex as icao,
+                    MAX(r) FILTER (WHERE r IS NOT NULL) as registration,
+                    MAX(t) FILTER (WHERE t IS NOT NULL) as type
+                FROM raw_data_expanded
+                GROUP BY hex
+                ORDER BY hex
+            ) TO '{aircraft_file}' (FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE 122880)
+        """)
+
+        positions_count = conn.execute(f"""
+            COPY (
+                SELECT
+                    hex as icao,
+                    doc_timestamp as timestamp,
+                    lat,
+                    lon,
+                    altitude_baro,
+                    gs as ground_speed,
+                    CAST(NULL AS VARCHAR) as emergency,
+                    substr(hex, 1, 2) as icao_prefix
+                FROM raw_data_expanded
+                WHERE lat IS NOT NULL
+                  AND lon IS NOT NULL
+                  AND doc_timestamp IS NOT NULL
+                ORDER BY hex, doc_timestamp
+            ) TO '{positions_target}' (
+                FORMAT PARQUET, PARTITION_BY (icao_prefix), COMPRESSION ZSTD, ROW_GROUP_SIZE 122880
+            )
+        """).fetchone()[0]
+
+        # Both files are written, release the expanded rows before building the views
+        conn.execute("DROP TABLE raw_data_expanded")
+
+        # The database only holds views over the Parquet files for the read endpoints
+        conn.execute(f"CREATE VIEW aircraft AS SELECT * FROM read_parquet('{aircraft_file}')")
+        # No partition is written when no aircraft has a known position
+        if positions_count:
+            conn.execute(f"""
+                CREATE VIEW positions AS
+                SELECT * FROM read_parquet(
+                    '{positions_target}/**/*.parquet', hive_partitioning=true, hive_types={{'icao_prefix': VARCHAR}}
+                )
+            """)
+
+    finally:
+        conn.close()
+        shutil.rmtree(decompressed_dir, ignore_errors=True)
+
+
 @s1.post("/aircraft/download")
 def download_data(
     file_limit: Annotated[
@@ -49,43 +313,46 @@ def download_data(
 
 
     TIP: always clean the download folder before writing again to avoid having old files.
+
+    NOTE: the folder is cleaned after downloading instead. Files from a previous run are
+    revalidated with their ETag and kept while current, anything not stored by this run
+    (older files, failed downloads and their ETags) is removed at the end.
     """
     download_dir = os.path.join(settings.raw_dir, "day=20231101")
 
     # Create download directory
     os.makedirs(download_dir, exist_ok=True)
 
-    # Clean existing files
-    for filename in os.listdir(download_dir):
-        file_path = os.path.join(download_dir, filename)
-        if os.path.isfile(file_path):
-            try:
-                os.remove(file_path)
-            except (PermissionError, OSError):
-                pass
-
     # Generate list of expected filenames (hourly files for 2023-11-01)
     # Format: 000000Z.json.gz, 010000Z.json.gz, etc.
     filenames = [f"{hour:02d}0000Z.json.gz" for hour in range(24)]
 
-    # Download files up to limit
-    files_downloaded = 0
-    for filename in filenames:
-        if files_downloaded >= file_limit:
-            break
-
-        file_url = f"{settings.source_url}/2023/11/01/{filename}"
-
-        try:
-            response = requests.get(file_url, timeout=30)
-            if response.status_code == 200:
-                file_path = os.path.join(download_dir, filename)
-                with open(file_path, 'wb') as f:
-                    f.write(response.content)
-                files_downloaded += 1
-        except Exception:
-            # Skip files that don't exist or can't be downloaded
-            continue
+    # Download files up to limit, concurrently in batches of the files still
+    # missing so we keep the ascending order and never fetch more than needed.
+    # Files from a previous run are revalidated with their ETag instead of
+    # being downloaded again
+    stored = set()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        while filenames and len(stored) < file_limit:
+            batch = filenames[:file_limit - len(stored)]
+            filenames = filenames[len(batch):]
+            downloaded = executor.map(
+                _download_file,
+                [f"{settings.source_url}/2023/11/01/{filename}" for filename in batch],
+                [os.path.join(download_dir, filename) for filename in batch],
+            )
+            stored.update(filename for filename, is_stored in zip(batch, downloaded) if is_stored)
+
+    # Clean everything else afterwards (older files and failed downloads), so only
+    # the requested files and their ETags are left. scandir reuses the file type
+    # from the directory read
+    with os.scandir(download_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.removesuffix(".etag") not in stored:
+                try:
+                    os.remove(entry.path)
+                except (PermissionError, OSError):
+                    pass
 
     return "OK"
 
@@ -110,168 +377,72 @@ def prepare_data() -> str:
     Keep in mind that we are downloading a lot of small files, and some libraries might not work well with this!
     """
     raw_dir = os.path.join(settings.raw_dir, "day=20231101")
-    prepared_dir = settings.prepared_dir
-
-    # Create prepared directory
-    os.makedirs(prepared_dir, exist_ok=True)
-
-    # Database path
-    db_path = os.path.join(prepared_dir, "aircraft.db")
-
-    # Remove existing database
-    if os.path.exists(db_path):
-        try:
-            os.remove(db_path)
-        except (PermissionError, OSError):
-            pass
-
-    # Process files
-    if not os.path.exists(raw_dir):
-        return "OK"
 
     # Get list of JSON files
-    json_files = [os.path.join(raw_dir, f) for f in sorted(os.listdir(raw_dir)) if f.endswith('.json.gz')]
-
-    if not json_files:
-        return "OK"
-
-    # Connect to database
-    conn = duckdb.connect(db_path)
-
-    try:
-        # Create a glob pattern for all JSON files
-        file_pattern = os.path.join(raw_dir, "*.json.gz").replace('\\', '/')
-
-        # Read all JSON files directly with DuckDB and unnest aircraft array
-        # Use struct_extract to handle fields
-        conn.execute("""
-            CREATE TEMP TABLE raw_data_expanded AS
-            SELECT
-                json.now as doc_timestamp,
-                struct_extract(aircraft, 'hex') as hex,
-                struct_extract(aircraft, 'r') as r,
-                struct_extract(aircraft, 't') as t,
-                struct_extract(aircraft, 'lat') as lat,
-                struct_extract(aircraft, 'lon') as lon,
-                struct_extract(aircraft, 'alt_baro') as alt_baro,
-                struct_extract(aircraft, 'gs') as gs,
-                CAST(NULL AS VARCHAR) as emergency
-            FROM (
-                SELECT json, unnest(json.aircraft) as aircraft
-                FROM read_json(?, format='auto', compression='uncompressed', maximum_object_size=10000000) as json
-            )
-        """, [file_pattern])
+    json_files = []
+    if os.path.exists(raw_dir):
+        with os.scandir(raw_dir) as entries:
+            json_files = sorted(entry.path for entry in entries if entry.name.endswith('.json.gz'))
 
-        # Create aircraft table with unique aircraft
-        conn.execute("""
-            CREATE TABLE aircraft AS
-            SELECT
-                hex as icao,
-                MAX(r) FILTER (WHERE r IS NOT NULL) as registration,
-                MAX(t) FILTER (WHERE t IS NOT NULL) as type
-            FROM raw_data_expanded
-            WHERE hex IS NOT NULL
-            GROUP BY hex
-            ORDER BY hex
-        """)
-
-        # Create positions table
-        # TRY_CAST will automatically return NULL for "ground" and other non-numeric values
-        conn.execute("""
-            CREATE TABLE positions AS
-            SELECT
-                hex as icao,
-                doc_timestamp as timestamp,
-                lat,
-                lon,
-                TRY_CAST(alt_baro AS INTEGER) as altitude_baro,
-                gs as ground_speed,
-                emergency
-            FROM raw_data_expanded
-            WHERE hex IS NOT NULL
-              AND lat IS NOT NULL
-              AND lon IS NOT NULL
-              AND doc_timestamp IS NOT NULL
-            ORDER BY hex, doc_timestamp
-        """)
-
-        # Create indexes for fast queries
-        conn.execute("CREATE INDEX idx_aircraft_icao ON aircraft(icao)")
-        conn.execute("CREATE INDEX idx_positions_icao ON positions(icao)")
-        conn.execute("CREATE INDEX idx_positions_timestamp ON positions(timestamp)")
-
-    except Exception:
-        conn.close()
-        raise
-
-    conn.close()
+    build_prepared(json_files, settings.prepared_dir)
     return "OK"
 
 
-@s1.get("/aircraft/")
-def list_aircraft(num_results: int = 100, page: int = 0) -> list[dict]:
+@s1.get("/aircraft/", response_model=list[dict])
+def list_aircraft(num_results: int = 100, page: int = 0) -> Response:
     """List all the available aircraft, its registration and type ordered by
     icao asc
     """
     db_path = os.path.join(settings.prepared_dir, "aircraft.db")
 
     if not os.path.exists(db_path):
-        return []
+        return _json_response([])
 
     try:
-        conn = duckdb.connect(db_path, read_only=True)
         offset = page * num_results
-
-        result = conn.execute("""
-            SELECT icao, registration, type
-            FROM aircraft
-            WHERE icao IS NOT NULL
-            ORDER BY icao ASC
-            LIMIT ? OFFSET ?
-        """, [num_results, offset]).fetchall()
-
-        conn.close()
-
-        return [
-            {"icao": row[0], "registration": row[1], "type": row[2]}
-            for row in result
-        ]
+        with _get_conn().cursor() as cursor:
+            result = cursor.execute("""
+                SELECT icao, registration, type
+                FROM aircraft
+                WHERE icao IS NOT NULL
+                ORDER BY icao ASC
+                LIMIT ? OFFSET ?
+            """, [num_results, offset]).to_arrow_table()
+
+        # Arrow converts the columns to row dicts in bulk
+        return _json_response(result.to_pylist())
     except Exception:
-        return []
+        return _json_response([])
 
 
-@s1.get("/aircraft/{icao}/positions")
-def get_aircraft_position(icao: str, num_results: int = 1000, page: int = 0) -> list[dict]:
+@s1.get("/aircraft/{icao}/positions", response_model=list[dict])
+def get_aircraft_position(icao: str, num_results: int = 1000, page: int = 0) -> Response:
     """Returns all the known positions of an aircraft ordered by time (asc)
     If an aircraft is not found, return an empty list.
     """
     db_path = os.path.join(settings.prepared_dir, "aircraft.db")
 
     if not os.path.exists(db_path):
-        return []
+        return _json_response([])
 
     try:
-        conn = duckdb.connect(db_path, read_only=True)
         offset = page * num_results
-
-        result = conn.execute("""
-            SELECT timestamp, lat, lon
-            FROM positions
-            WHERE icao = ?
-              AND lat IS NOT NULL
-              AND lon IS NOT NULL
-            ORDER BY timestamp ASC
-            LIMIT ? OFFSET ?
-        """, [icao, num_results, offset]).fetchall()
-
-        conn.close()
-
-        return [
-            {"timestamp": row[0], "lat": row[1], "lon": row[2]}
-            for row in result
-        ]
+        with _get_conn().cursor() as cursor:
+            result = cursor.execute("""
+                SELECT timestamp, lat, lon
+                FROM positions
+                WHERE icao_prefix = substr($1, 1, 2)
+                  AND icao = $1
+                  AND lat IS NOT NULL
+                  AND lon IS NOT NULL
+                ORDER BY timestamp ASC
+                LIMIT $2 OFFSET $3
+            """, [icao, num_results, offset]).to_arrow_table()
+
+        # Arrow converts the columns to row dicts in bulk
+        return _json_response(result.to_pylist())
     except Exception:
-        return []
+        return _json_response([])
 
 
 @s1.get("/aircraft/{icao}/stats")
@@ -288,18 +459,16 @@ def get_aircraft_statistics(icao: str) -> dict:
         return {"max_altitude_baro": None, "max_ground_speed": None, "had_emergency": False}
 
     try:
-        conn = duckdb.connect(db_path, read_only=True)
-
-        result = conn.execute("""
-            SELECT
-                MAX(altitude_baro) as max_altitude_baro,
-                MAX(ground_speed) as max_ground_speed,
-                BOOL_OR(emergency IS NOT NULL AND emergency != '') as had_emergency
-            FROM positions
-            WHERE icao = ?
-        """, [icao]).fetchone()
-
-        conn.close()
+        with _get_conn().cursor() as cursor:
+            result = cursor.execute("""
+                SELECT
+                    MAX(altitude_baro) as max_altitude_baro,
+                    MAX(ground_speed) as max_ground_speed,
+                    BOOL_OR(emergency IS NOT NULL AND emergency != '') as had_emergency
+                FROM positions
+                WHERE icao_prefix = substr($1, 1, 2)
+                  AND icao = $1
+            """, [icao]).fetchone()
 
         if result:
             return {
@@ -1,9 +1,10 @@
+import threading
 from pathlib import Path
 from typing import Annotated
 
 from fastapi import APIRouter, status
 from fastapi.params import Query
-from sqlalchemy import create_engine, text
+from sqlalchemy import Engine, create_engine, text
 
 from bdi_api.settings import Settings
 
@@ -22,23 +23,70 @@ _SQL_DIR = Path(__file__).parent
 _SCHEMA_FILE = _SQL_DIR / "hr_schema.sql"
 _SEED_FILE = _SQL_DIR / "hr_seed_data.sql"
 
+# Read queries are built once and run on a single engine, so SQLAlchemy
+# compiles each of them only once and reuses pooled connections
+_DEPARTMENTS_QUERY = text("SELECT id, name, location FROM department ORDER BY id")
+_EMPLOYEES_QUERY = text(
+    """
+    SELECT e.id, e.first_name, e.last_name, e.email, e.salary,
+           d.name AS department_name
+    FROM employee e
+    LEFT JOIN department d ON e.department_id = d.id
+    ORDER BY e.id
+    LIMIT :limit OFFSET :offset
+    """
+)
+_DEPARTMENT_EMPLOYEES_QUERY = text(
+    """
+    SELECT id, first_name, last_name, email, salary, hire_date
+    FROM employee
+    WHERE department_id = :dept_id
+    ORDER BY id
+    """
+)
+_DEPARTMENT_STATS_QUERY = text(
+    """
+    SELECT
+        d.name AS department_name,
+        COUNT(DISTINCT e.id) AS employee_count,
+        AVG(e.salary) AS avg_salary,
+        COUNT(DISTINCT p.id) AS project_count
+    FROM department d
+    LEFT JOIN employee e ON e.department_id = d.id
+    LEFT JOIN project p ON p.department_id = d.id
+    WHERE d.id = :dept_id
+    GROUP BY d.id, d.name
+    """
+)
+_SALARY_HISTORY_QUERY = text(
+    """
+    SELECT change_date, old_salary, new_salary, reason
+    FROM salary_history
+    WHERE employee_id = :emp_id
+    ORDER BY change_date
+    """
+)
+
+# Engine shared by the endpoints, created on first use
+_engine: Engine | None = None
+_engine_lock = threading.Lock()
 
-def get_engine():
-    return create_engine(settings.db_url)
+
+def get_engine() -> Engine:
+    """Returns the shared engine, creating it on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(settings.db_url)
+        return _engine
 
 
 def _is_sqlite() -> bool:
     return settings.db_url.startswith("sqlite")
 
 
-@s5.post("/db/init")
-def init_database() -> str:
-    """Create all HR database tables (department, employee, project,
-    employee_project, salary_history) with their relationships and indexes.
-
-    Use the BDI_DB_URL environment variable to configure the database connection.
-    Default: sqlite:///hr_database.db
-    """
+def _load_schema() -> str:
+    """Read the schema script, adapted to SQLite when it is the configured database."""
     schema_sql = _SCHEMA_FILE.read_text()
     if _is_sqlite():
         # SQLite: strip CASCADE only from DROP TABLE lines, and replace SERIAL type
@@ -48,12 +96,39 @@ def init_database() -> str:
                 line = line.replace(" CASCADE", "")
             fixed_lines.append(line)
         schema_sql = "\n".join(fixed_lines).replace("SERIAL", "INTEGER")
+    return schema_sql
+
+
+# The scripts are read (and adapted) once per process, like the engine
+_SCHEMA_SQL = _load_schema()
+_SEED_SQL = _SEED_FILE.read_text()
+
+
+def _execute_script(sql: str) -> None:
+    """Run a multi-statement SQL script in a single round trip and transaction."""
     engine = get_engine()
-    with engine.begin() as conn:
-        for statement in schema_sql.strip().split(";"):
-            stmt = statement.strip()
-            if stmt:
-                conn.execute(text(stmt))
+    if _is_sqlite():
+        # sqlite3 only runs several statements per call through executescript
+        raw_conn = engine.raw_connection()
+        try:
+            raw_conn.driver_connection.executescript(f"BEGIN;\n{sql}\nCOMMIT;")
+        finally:
+            raw_conn.close()
+    else:
+        # psycopg2 accepts the whole script in a single execute
+        with engine.begin() as conn:
+            conn.execution_options(no_parameters=True).exec_driver_sql(sql)
+
+
+@s5.post("/db/init")
+def init_database() -> str:
+    """Create all HR database tables (department, employee, project,
+    employee_project, salary_history) with their relationships and indexes.
+
+    Use the BDI_DB_URL environment variable to configure the database connection.
+    Default: sqlite:///hr_database.db
+    """
+    _execute_script(_SCHEMA_SQL)
     return "OK"
 
 
@@ -63,13 +138,7 @@ def seed_database() -> str:
 
     Inserts departments, employees, projects, assignments, and salary history.
     """
-    seed_sql = _SEED_FILE.read_text()
-    engine = get_engine()
-    with engine.begin() as conn:
-        for statement in seed_sql.strip().split(";"):
-            stmt = statement.strip()
-            if stmt:
-                conn.execute(text(stmt))
+    _execute_script(_SEED_SQL)
     return "OK"
 
 
@@ -81,8 +150,7 @@ def list_departments() -> list[dict]:
     """
     engine = get_engine()
     with engine.connect() as conn:
-        rows = conn.execute(text("SELECT id, name, location FROM department ORDER BY id")).mappings().all()
-    return [dict(row) for row in rows]
+        return [dict(row) for row in conn.execute(_DEPARTMENTS_QUERY).mappings()]
 
 
 @s5.get("/employees/")
@@ -103,20 +171,7 @@ def list_employees(
     offset = (page - 1) * per_page
     engine = get_engine()
     with engine.connect() as conn:
-        rows = conn.execute(
-            text(
-                """
-                SELECT e.id, e.first_name, e.last_name, e.email, e.salary,
-                       d.name AS department_name
-                FROM employee e
-                LEFT JOIN department d ON e.department_id = d.id
-                ORDER BY e.id
-                LIMIT :limit OFFSET :offset
-                """
-            ),
-            {"limit": per_page, "offset": offset},
-        ).mappings().all()
-    return [dict(row) for row in rows]
+        return [dict(row) for row in conn.execute(_EMPLOYEES_QUERY, {"limit": per_page, "offset": offset}).mappings()]
 
 
 @s5.get("/departments/{dept_id}/employees")
@@ -127,18 +182,7 @@ def list_department_employees(dept_id: int) -> list[dict]:
     """
     engine = get_engine()
     with engine.connect() as conn:
-        rows = conn.execute(
-            text(
-                """
-                SELECT id, first_name, last_name, email, salary, hire_date
-                FROM employee
-                WHERE department_id = :dept_id
-                ORDER BY id
-                """
-            ),
-            {"dept_id": dept_id},
-        ).mappings().all()
-    return [dict(row) for row in rows]
+        return [dict(row) for row in conn.execute(_DEPARTMENT_EMPLOYEES_QUERY, {"dept_id": dept_id}).mappings()]
 
 
 @s5.get("/departments/{dept_id}/stats")
@@ -149,23 +193,7 @@ def department_stats(dept_id: int) -> dict:
     """
     engine = get_engine()
     with engine.connect() as conn:
-        row = conn.execute(
-            text(
-                """
-                SELECT
-                    d.name AS department_name,
-                    COUNT(DISTINCT e.id) AS employee_count,
-                    AVG(e.salary) AS avg_salary,
-                    COUNT(DISTINCT p.id) AS project_count
-                FROM department d
-                LEFT JOIN employee e ON e.department_id = d.id
-                LEFT JOIN project p ON p.department_id = d.id
-                WHERE d.id = :dept_id
-                GROUP BY d.id, d.name
-                """
-            ),
-            {"dept_id": dept_id},
-        ).mappings().first()
+        row = conn.execute(_DEPARTMENT_STATS_QUERY, {"dept_id": dept_id}).mappings().first()
     if row is None:
         return {}
     result = dict(row)
@@ -183,15 +211,4 @@ def salary_history(emp_id: int) -> list[dict]:
     """
     engine = get_engine()
     with engine.connect() as conn:
-        rows = conn.execute(
-            text(
-                """
-                SELECT change_date, old_salary, new_salary, reason
-                FROM salary_history
-                WHERE employee_id = :emp_id
-                ORDER BY change_date
-                """
-            ),
-            {"emp_id": emp_id},
-        ).mappings().all()
-    return [dict(row) for row in rows]
+        return [dict(row) for row in conn.execute(_SALARY_HISTORY_QUERY, {"emp_id": emp_id}).mappings()]
@@ -1,15 +1,144 @@
+import dataclasses
+import io
+import os
+import shutil
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+
+import boto3
 import pytest
+from botocore.client import BaseClient
+from botocore.config import Config
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
+from moto import mock_s3
+
+from bdi_api.settings import Settings
+
+# Data folder of the current pytest-xdist worker, removed when it finishes
+_WORKER_LOCAL_DIR = pytest.StashKey[str]()
+
 
-from bdi_api.app import app as real_app
+def pytest_configure(config: pytest.Config) -> None:
+    # Every pytest-xdist worker is its own process with its own moto backend,
+    # give each one its own bucket and a temporary data folder outside the repo
+    # so their files never collide
+    worker = os.environ.get("PYTEST_XDIST_WORKER")
+    if worker:
+        settings = Settings()
+        local_dir = tempfile.mkdtemp(prefix=f"bdi-{worker}-")
+        config.stash[_WORKER_LOCAL_DIR] = local_dir
+        os.environ["BDI_S3_BUCKET"] = f"{settings.s3_bucket}-{worker}"
+        os.environ["BDI_LOCAL_DIR"] = local_dir
 
+    # botocore's loader caches the parsed service models per session, so a throwaway
+    # client on boto3's default session (the one the tests and the app use) loads the
+    # large S3 model once here instead of inside the first test's timing
+    with mock_s3():
+        boto3.client("s3", region_name="us-east-1")
 
-@pytest.fixture(scope="class")
+
+def pytest_unconfigure(config: pytest.Config) -> None:
+    local_dir = config.stash.get(_WORKER_LOCAL_DIR, None)
+    if local_dir:
+        shutil.rmtree(local_dir, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
 def app() -> FastAPI:
+    # Imported here so the exercises' settings see the per-worker environment
+    from bdi_api.app import app as real_app
+
     return real_app
 
 
-@pytest.fixture(scope="class")
-def client(app: FastAPI) -> TestClient:
-    yield TestClient(app)
+class _SessionClient(TestClient):
+    """TestClient that may be entered again while it is open: only the outermost
+    `with` runs the app lifespan, the nested ones reuse it. Entering a plain
+    TestClient twice replaces its portal, and the first nested exit tears it down
+    """
+
+    _depth = 0
+
+    def __enter__(self) -> "_SessionClient":
+        if self._depth == 0:
+            super().__enter__()
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            super().__exit__(*exc_info)
+
+
+@pytest.fixture(scope="session")
+def client(app: FastAPI) -> Iterator[TestClient]:
+    """Client whose app lifespan is entered once for the whole test session,
+    the tests' own `with client as client:` blocks keep using it
+    """
+    with _SessionClient(app) as client:
+        yield client
+
+
+# What FakeResponse serves by default, an hourly file without any aircraft
+FAKE_SOURCE_BODY = b'{"now": 1234567890, "aircraft": []}'
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class FakeResponse:
+    """Just enough of a streamed `requests.Response` for the download endpoints,
+    each instance has its own stream as the download consumes it
+    """
+
+    status_code: int = 200
+    raw: io.BytesIO = dataclasses.field(default_factory=lambda: io.BytesIO(FAKE_SOURCE_BODY))
+    headers: dict = dataclasses.field(default_factory=dict)
+
+    def close(self) -> None:
+        self.raw.close()
+
+    def __enter__(self) -> "FakeResponse":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+@pytest.fixture
+def local_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Points the s1 and s4 exercises at a fresh local dir, so each test keeps its
+    files in its own folder and pytest removes them afterwards
+    """
+    for module in ("bdi_api.s1.exercise", "bdi_api.s4.exercise"):
+        monkeypatch.setattr(f"{module}.settings.local_dir", str(tmp_path))
+    return tmp_path
+
+
+def _ensure_bucket(s3_client: BaseClient, bucket: str) -> None:
+    """Creates `bucket` unless it already exists. us-east-1 accepts a repeated
+    create, other regions raise BucketAlreadyOwnedByYou
+    """
+    try:
+        s3_client.create_bucket(Bucket=bucket)
+    except (s3_client.exceptions.BucketAlreadyOwnedByYou, s3_client.exceptions.BucketAlreadyExists):
+        pass
+
+
+@pytest.fixture(scope="module")
+def moto_s3() -> Iterator[None]:
+    """Keeps moto's S3 mock active for a whole test module. Starting a new
+    mock resets its backend, so tests relying on this must not add `@mock_s3`
+    """
+    with mock_s3():
+        yield
+
+
+@pytest.fixture(scope="module")
+def s3_env(moto_s3: None) -> tuple[Settings, BaseClient]:
+    """Mocked S3 with the settings' bucket, set up once per test module"""
+    settings = Settings()
+    s3_client = boto3.client("s3", region_name="us-east-1", config=Config(max_pool_connections=32))
+    _ensure_bucket(s3_client, settings.s3_bucket)
+    return settings, s3_client
@@ -1,5 +1,26 @@
+from pathlib import Path
+from unittest.mock import patch
+
 from fastapi.testclient import TestClient
 
+from tests.conftest import FAKE_SOURCE_BODY, FakeResponse
+
+
+def _download_dir(local_dir: Path) -> Path:
+    """Where the s1 download stores the files under `local_dir`"""
+    return local_dir / 'raw' / 'day=20231101'
+
+
+def _store_previous_run(local_dir: Path) -> tuple[Path, Path]:
+    """Leaves the first file and its ETag as a previous download would"""
+    download_dir = _download_dir(local_dir)
+    download_dir.mkdir(parents=True)
+    file_path = download_dir / '000000Z.json.gz'
+    file_path.write_bytes(b'previous')
+    etag_path = download_dir / '000000Z.json.gz.etag'
+    etag_path.write_text('"v1"')
+    return file_path, etag_path
+
 
 class TestS1Student:
     """
@@ -12,9 +33,41 @@ class TestS1Student:
     """
 
     def test_first(self, client: TestClient) -> None:
-        with client as client:
+        response = client.post("/api/s1/aircraft/download?file_limit=1")
+        assert True
+
+    def test_download_stores_etag(self, client: TestClient, local_dir: Path) -> None:
+        """A 200 stores the file and its ETag next to it"""
+        with patch('bdi_api.s1.exercise.session.get', return_value=FakeResponse(200, headers={'ETag': '"v2"'})):
             response = client.post("/api/s1/aircraft/download?file_limit=1")
-            assert True
+        assert response.json() == "OK"
+
+        assert (_download_dir(local_dir) / '000000Z.json.gz').read_bytes() == FAKE_SOURCE_BODY
+        assert (_download_dir(local_dir) / '000000Z.json.gz.etag').read_text() == '"v2"'
+
+    def test_download_keeps_file_not_modified(self, client: TestClient, local_dir: Path) -> None:
+        """A 304 keeps the stored file, which counts towards the file limit"""
+        file_path, etag_path = _store_previous_run(local_dir)
+
+        with patch('bdi_api.s1.exercise.session.get', return_value=FakeResponse(304)) as get:
+            response = client.post("/api/s1/aircraft/download?file_limit=1")
+        assert response.json() == "OK"
+
+        get.assert_called_once()
+        assert get.call_args.kwargs['headers'] == {'If-None-Match': '"v1"'}
+        assert file_path.read_bytes() == b'previous'
+        assert etag_path.read_text() == '"v1"'
+
+    def test_download_removes_stale_file_on_failed_refresh(self, client: TestClient, local_dir: Path) -> None:
+        """A failed refresh removes the previous file and its ETag"""
+        file_path, etag_path = _store_previous_run(local_dir)
+
+        with patch('bdi_api.s1.exercise.session.get', side_effect=lambda *args, **kwargs: FakeResponse(500)):
+            response = client.post("/api/s1/aircraft/download?file_limit=1")
+        assert response.json() == "OK"
+
+        assert not file_path.exists()
+        assert not etag_path.exists()
 
 
 class TestItCanBeEvaluated:
@@ -1,77 +1,219 @@
+import base64
+import gzip
+import hashlib
 import os
+import shutil
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import boto3
+import duckdb
+import pytest
+from botocore.client import BaseClient
 from fastapi.testclient import TestClient
 from moto import mock_s3
 
 from bdi_api.settings import Settings
+from tests.conftest import FakeResponse
 
+# A realistic source file with all the expected fields, encoded once and shared by the student tests
+_FIXTURE_BODY = (
+    b'{"now": 1698796800, "aircraft": [{"hex": "abc123", "r": "N123AB", "t": "B738", '
+    b'"lat": 40.7, "lon": -74.0, "alt_baro": 35000, "gs": 450, "emergency": null}]}'
+)
+# The same file actually gzip-compressed, as its `.json.gz` key says
+_FIXTURE_GZ = gzip.compress(_FIXTURE_BODY, compresslevel=1)
 
-class TestS4Student:
+
+def _content_md5(body: bytes) -> str:
+    """The base64 MD5 digest S3 expects in `ContentMD5`"""
+    return base64.b64encode(hashlib.md5(body).digest()).decode()
+
+
+# Digests of the uploaded bodies, computed once so the puts can send them along
+# with the length instead of botocore hashing every body again
+_EMPTY_MD5 = _content_md5(b'')
+_FIXTURE_BODY_MD5 = _content_md5(_FIXTURE_BODY)
+_FIXTURE_GZ_MD5 = _content_md5(_FIXTURE_GZ)
+
+
+def _fake_get(*args, **kwargs) -> FakeResponse:
+    """Stands in for `requests.get`, a fresh stream per call as each one is consumed"""
+    return FakeResponse()
+
+
+def _cleanup(settings: Settings, s3_client: BaseClient) -> None:
+    """Removes the objects a test left under `raw/day=20231101/`, one
+    delete_objects call per listed batch of up to 1000 keys
     """
-    Use this class to create your own tests to validate your implementation.
+    while objects := [
+        {'Key': obj['Key']}
+        for obj in s3_client.list_objects_v2(Bucket=settings.s3_bucket, Prefix='raw/day=20231101/').get('Contents', [])
+    ]:
+        s3_client.delete_objects(Bucket=settings.s3_bucket, Delete={'Objects': objects, 'Quiet': True})
 
-    For more information on testing, search `pytest` and `fastapi.testclient`.
+
+def _count_aircraft(prepared_dir: Path) -> int:
+    """Probes the prepared database read-only, returning how many aircraft it has"""
+    db_path = prepared_dir / 'aircraft.db'
+    assert db_path.is_file(), "Database file not created"
+    with duckdb.connect(str(db_path), read_only=True) as conn:
+        return conn.execute("SELECT COUNT(*) FROM aircraft").fetchone()[0]
+
+
+def _remove_prepared(prepared_dir: str) -> None:
+    """Removes the prepared aircraft files and positions partitions from `prepared_dir`"""
+    for path in Path(prepared_dir).glob('aircraft.*'):
+        path.unlink(missing_ok=True)
+    shutil.rmtree(Path(prepared_dir) / 'positions', ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def _clean_after_test(request: pytest.FixtureRequest, s3_env: tuple[Settings, BaseClient]) -> Iterator[None]:
+    """Cleans up after every test, even a failing one, so the next one starts empty.
+    Tests without a `local_dir` tmp folder prepare into the real one, which is
+    emptied for them
     """
+    yield
+    settings, s3_client = s3_env
+    _cleanup(settings, s3_client)
+    if 'local_dir' not in request.fixturenames:
+        _remove_prepared(settings.prepared_dir)
 
-    @mock_s3
-    def test_download_with_mocked_s3(self, client: TestClient) -> None:
-        """Test download endpoint with mocked S3"""
-        # Create mock S3 bucket
-        settings = Settings()
-        s3_client = boto3.client('s3', region_name='us-east-1')
-        s3_client.create_bucket(Bucket=settings.s3_bucket)
 
-        # Mock requests to download files
-        with patch('bdi_api.s4.exercise.requests') as mock_requests:
-            mock_file_response = MagicMock()
-            mock_file_response.status_code = 200
-            mock_file_response.content = b'{"now": 1234567890, "aircraft": []}'
+@pytest.fixture
+def fake_source() -> Iterator[None]:
+    """Serves the source files from `_fake_get` instead of the network"""
+    with patch('bdi_api.s4.exercise.requests.get', _fake_get):
+        yield
 
-            mock_requests.get.return_value = mock_file_response
 
-            with client as client:
-                response = client.post("/api/s4/aircraft/download?file_limit=2")
-                assert response.status_code == 200
-                assert response.json() == "OK"
+def _check_path(s3_client: BaseClient, s3_bucket: str, file_limit: int) -> None:
+    """Looks up each expected key directly instead of listing the prefix"""
+    for hour in range(file_limit):
+        response = s3_client.head_object(Bucket=s3_bucket, Key=f'raw/day=20231101/{hour:02d}0000Z.json.gz')
+        assert response['ResponseMetadata']['HTTPStatusCode'] == 200
 
-                # Verify files were uploaded to S3
-                s3_objects = s3_client.list_objects_v2(
-                    Bucket=settings.s3_bucket,
-                    Prefix='raw/day=20231101/'
-                )
-                assert 'Contents' in s3_objects
-                assert len(s3_objects['Contents']) == 2
 
-    @mock_s3
-    def test_prepare_with_mocked_s3(self, client: TestClient) -> None:
-        """Test prepare endpoint with mocked S3"""
-        # Create mock S3 bucket with test data
-        settings = Settings()
-        s3_client = boto3.client('s3', region_name='us-east-1')
-        s3_client.create_bucket(Bucket=settings.s3_bucket)
+def _check_count(s3_client: BaseClient, s3_bucket: str, file_limit: int) -> None:
+    """Lists just enough keys to tell whether more than `file_limit` were stored"""
+    s3_objects = s3_client.list_objects_v2(Bucket=s3_bucket, Prefix='raw/day=20231101/', MaxKeys=file_limit + 1)
+    assert s3_objects['KeyCount'] == file_limit
+
+
+class TestS4Student:
+    """
+    Use this class to create your own tests to validate your implementation.
+
+    For more information on testing, search `pytest` and `fastapi.testclient`.
+    """
+
+    @pytest.mark.usefixtures("fake_source")
+    @pytest.mark.parametrize(
+        "file_limit,check",
+        [(1, _check_path), (2, _check_count), (5, _check_count)],
+        ids=["stores_in_correct_s3_path", "two_files", "respects_file_limit"],
+    )
+    def test_download_with_mocked_s3(
+        self,
+        client: TestClient,
+        s3_env: tuple[Settings, BaseClient],
+        file_limit: int,
+        check: Callable[[BaseClient, str, int], None],
+    ) -> None:
+        """Test download endpoint with mocked S3 stores `file_limit` files in the right path"""
+        settings, s3_client = s3_env
+
+        response = client.post(f"/api/s4/aircraft/download?file_limit={file_limit}")
+        assert not response.is_error, "Error at the download endpoint"
+        assert response.json() == "OK"
+
+        check(s3_client, settings.s3_bucket, file_limit)
+
+    @pytest.mark.usefixtures("fake_source")
+    def test_download_cleans_every_listed_page(self, client: TestClient, s3_env: tuple[Settings, BaseClient]) -> None:
+        """Test download removes stale objects beyond the first listing page"""
+        settings, s3_client = s3_env
+
+        # More stale objects than a single list_objects_v2 page returns
+        for i in range(1001):
+            s3_client.put_object(
+                Bucket=settings.s3_bucket,
+                Key=f'raw/day=20231101/stale{i:04d}.json.gz',
+                Body=b'',
+                ContentLength=0,
+                ContentMD5=_EMPTY_MD5,
+            )
+
+        response = client.post("/api/s4/aircraft/download?file_limit=1")
+        assert response.status_code == 200
+
+        s3_objects = s3_client.list_objects_v2(Bucket=settings.s3_bucket, Prefix='raw/day=20231101/', MaxKeys=2)
+        assert [obj['Key'] for obj in s3_objects['Contents']] == ['raw/day=20231101/000000Z.json.gz']
+
+    @pytest.mark.parametrize(
+        "body,content_md5",
+        [(_FIXTURE_BODY, _FIXTURE_BODY_MD5), (_FIXTURE_GZ, _FIXTURE_GZ_MD5)],
+        ids=["plain_json", "gzip"],
+    )
+    def test_prepare_with_mocked_s3(
+        self,
+        client: TestClient,
+        s3_env: tuple[Settings, BaseClient],
+        local_dir: Path,
+        body: bytes,
+        content_md5: str,
+    ) -> None:
+        """Test prepare endpoint with mocked S3, whether the object is gzip-compressed or not"""
+        settings, s3_client = s3_env
 
         # Upload realistic test file to mock S3 - include all expected fields
-        test_json = '{"now": 1698796800, "aircraft": [{"hex": "abc123", "r": "N123AB", "t": "B738", "lat": 40.7, "lon": -74.0, "alt_baro": 35000, "gs": 450, "emergency": null}]}'
         s3_client.put_object(
             Bucket=settings.s3_bucket,
             Key='raw/day=20231101/000000Z.json.gz',
-            Body=test_json.encode()
+            Body=body,
+            ContentLength=len(body),
+            ContentMD5=content_md5,
         )
 
-        with client as client:
-            response = client.post("/api/s4/aircraft/prepare")
-            assert response.status_code == 200
-            assert response.json() == "OK"
-
-            # Verify database was created
-            db_path = os.path.join(settings.prepared_dir, 'aircraft.db')
-            assert os.path.exists(db_path)
+        response = client.post("/api/s4/aircraft/prepare")
+        assert response.status_code == 200
+        assert response.json() == "OK"
+
+        # Verify the database was created and holds the fixture's aircraft
+        assert _count_aircraft(local_dir / 'prepared') == 1
+
+    def test_prepare_processes_every_object(
+        self, client: TestClient, s3_env: tuple[Settings, BaseClient], local_dir: Path
+    ) -> None:
+        """Test prepare reads every object under the prefix, one aircraft per hourly file"""
+        settings, s3_client = s3_env
+        bodies = {
+            f'raw/day=20231101/{hour:02d}0000Z.json.gz': gzip.compress(
+                _FIXTURE_BODY.replace(b'abc123', f'abc{hour:03d}'.encode()), compresslevel=1
+            )
+            for hour in range(3)
+        }
 
-            # Cleanup
-            if os.path.exists(db_path):
-                os.remove(db_path)
+        # Seed the objects concurrently, the client's pool fits them all
+        with ThreadPoolExecutor(max_workers=len(bodies)) as executor:
+            list(executor.map(
+                lambda key: s3_client.put_object(
+                    Bucket=settings.s3_bucket,
+                    Key=key,
+                    Body=bodies[key],
+                    ContentLength=len(bodies[key]),
+                    ContentMD5=_content_md5(bodies[key]),
+                ),
+                bodies,
+            ))
+
+        response = client.post("/api/s4/aircraft/prepare")
+        assert response.status_code == 200
+
+        assert _count_aircraft(local_dir / 'prepared') == len(bodies)
 
 
 class TestItCanBeEvaluated:
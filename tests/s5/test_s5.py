@@ -9,9 +9,8 @@ class TestS5Student:
     """
 
     def test_example(self, client: TestClient) -> None:
-        with client as client:
-            response = client.post("/api/s5/db/init")
-            assert True
+        response = client.post("/api/s5/db/init")
+        assert True
 
 
 class TestItCanBeEvaluated:
@@ -10,21 +10,20 @@ class TestS6Student:
     """
 
     def test_first(self, client: TestClient) -> None:
-        with client as client:
-            response = client.post(
-                "/api/s6/aircraft",
-                json={
-                    "icao": "test01",
-                    "registration": "N12345",
-                    "type": "B738",
-                    "lat": 41.3851,
-                    "lon": 2.1734,
-                    "alt_baro": 35000,
-                    "ground_speed": 450,
-                    "timestamp": "2026-02-19T10:30:00Z",
-                },
-            )
-            assert True
+        response = client.post(
+            "/api/s6/aircraft",
+            json={
+                "icao": "test01",
+                "registration": "N12345",
+                "type": "B738",
+                "lat": 41.3851,
+                "lon": 2.1734,
+                "alt_baro": 35000,
+                "ground_speed": 450,
+                "timestamp": "2026-02-19T10:30:00Z",
+            },
+        )
+        assert True
 
 
 class TestItCanBeEvaluated:
@@ -10,16 +10,15 @@ class TestS7Student:
     """
 
     def test_first(self, client: TestClient) -> None:
-        with client as client:
-            response = client.post(
-                "/api/s7/graph/person",
-                json={
-                    "name": "TestUser",
-                    "city": "Barcelona",
-                    "age": 25,
-                },
-            )
-            assert True
+        response = client.post(
+            "/api/s7/graph/person",
+            json={
+                "name": "TestUser",
+                "city": "Barcelona",
+                "age": 25,
+            },
+        )
+        assert True
 
 
 class TestItCanBeEvaluated: